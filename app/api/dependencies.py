@@ -1,8 +1,18 @@
 from fastapi import Request, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Optional
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+from cachetools import TTLCache
+from redis.exceptions import RedisError
+import asyncio
+import hashlib
 import logging
+import time
+import uuid
+import torch
 
+from app.core.config import settings, redis_client
 from app.models.flux_model import model_manager
 from app.core.exceptions import ModelLoadError
 from app.utils.response_utils import get_base_url_from_request
@@ -13,12 +23,74 @@ logger = logging.getLogger(__name__)
 security = HTTPBearer(auto_error=False)
 
 
+class TokenValidator:
+    """Bearer token校验器
+    
+    校验结果按token哈希缓存（不保存明文token），缓存项同时受TTL和token自身过期时间约束；
+    同一token的并发首次校验通过per-key锁合并为一次。
+    """
+    
+    def __init__(self, maxsize: int = 10_000, ttl: int = 300):
+        self.ttl = ttl
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)  # {token_hash: (user_id, exp)}
+        self._locks: Dict[bytes, asyncio.Lock] = {}
+        self._lock_users: Dict[bytes, int] = {}  # 持有或等待各锁的协程数，归零时才删除锁
+    
+    async def _verify(self, token: str) -> Tuple[str, float]:
+        """校验token，返回 (用户ID, 过期时间戳)"""
+        # 这里可以添加token验证逻辑
+        # 目前使用token的哈希作为用户ID：按token稳定、长度固定（20位十六进制），可以安全地写入日志
+        user_id = hashlib.blake2s(token.encode(), digest_size=10).hexdigest()
+        return user_id, time.time() + self.ttl
+    
+    def _lookup(self, key: bytes) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        user_id, exp = entry
+        if exp < time.time():
+            self._cache.pop(key, None)
+            return None
+        return user_id
+    
+    async def validate(self, token: str) -> str:
+        """校验token并返回用户ID"""
+        key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        
+        user_id = self._lookup(key)
+        if user_id is not None:
+            return user_id
+        
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                # 等待期间可能已由其他请求完成校验
+                user_id = self._lookup(key)
+                if user_id is None:
+                    user_id, exp = await self._verify(token)
+                    self._cache[key] = (user_id, exp)
+                return user_id
+        finally:
+            # 最后一个使用者退出时才删除锁，保证仍在等待的协程与后来者共用同一把锁
+            remaining = self._lock_users[key] - 1
+            if remaining:
+                self._lock_users[key] = remaining
+            else:
+                del self._lock_users[key]
+                del self._locks[key]
+
+
+# token校验器实例
+token_validator = TokenValidator()
+
+
 async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[str]:
     """获取当前用户（可选认证）"""
     if credentials:
-        # 这里可以添加token验证逻辑
-        # 目前只是简单返回token作为用户ID
-        return credentials.credentials[:20]  # 截取前20个字符作为用户ID
+        return await token_validator.validate(credentials.credentials)
     return None
 
 
@@ -35,13 +107,16 @@ async def get_base_url(request: Request) -> str:
     return get_base_url_from_request(request)
 
 
+# POST请求允许的content-type前缀
+_ALLOWED_CONTENT_TYPES = ("application/json", "multipart/form-data")
+
+
 async def validate_content_type(request: Request):
     """验证请求内容类型"""
-    content_type = request.headers.get("content-type", "")
-    
     # 对于POST请求，验证content-type
     if request.method == "POST":
-        if not content_type.startswith("application/json") and not content_type.startswith("multipart/form-data"):
+        content_type = request.headers.get("content-type", "")
+        if not content_type.startswith(_ALLOWED_CONTENT_TYPES):
             raise HTTPException(
                 status_code=415,
                 detail="Unsupported Media Type. Expected application/json or multipart/form-data"
@@ -55,7 +130,11 @@ async def log_request(request: Request, user_id: Optional[str] = Depends(get_cur
     client_ip = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "unknown")
     
-    logger.info(f"Request: {request.method} {request.url.path} - IP: {client_ip} - User: {user_id} - UA: {user_agent}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Request: %s %s - IP: %s - User: %s - UA: %s",
+            request.method, request.url.path, client_ip, user_id, user_agent
+        )
     
     return {
         "ip": client_ip,
@@ -64,48 +143,157 @@ async def log_request(request: Request, user_id: Optional[str] = Depends(get_cur
     }
 
 
+# 滑动窗口限流脚本：清理过期记录、计数、写入当前请求在一次往返内原子完成
+# KEYS[1]=限流键 ARGV[1]=当前时间(ms) ARGV[2]=窗口(ms) ARGV[3]=最大请求数 ARGV[4]=请求唯一标识
+_SLIDING_WINDOW_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+local n = redis.call('ZCARD', KEYS[1])
+if n < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return limit - n - 1
+end
+return -1
+"""
+
+
 class RateLimiter:
-    """简单的速率限制器"""
+    """进程内滑动窗口速率限制器
+    
+    每个IP对应一个按时间排序的请求时间戳队列，检查时从队首弹出已过期的记录，
+    与Redis限流器的滑动窗口语义一致。读取与写回之间没有 await，在单线程事件循环中无需加锁。
+    跟踪的IP数量按LRU上限淘汰，内存占用有界。
+    """
     
-    def __init__(self, max_requests: int = 100, window_seconds: int = 3600):
+    def __init__(
+        self,
+        max_requests: int = 100,
+        window_seconds: int = 3600,
+        sweep_interval: int = 60,
+        max_tracked_ips: int = 100_000
+    ):
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self.requests = {}  # {ip: [(timestamp, count), ...]}
+        self.sweep_interval = sweep_interval
+        self.max_tracked_ips = max_tracked_ips
+        self.requests: "OrderedDict[str, Deque[float]]" = OrderedDict()  # {ip: deque[timestamp]}，按最近访问排序
+        self._sweeper: Optional[asyncio.Task] = None
     
     async def check_rate_limit(self, request: Request):
         """检查速率限制"""
-        import time
-        
         client_ip = request.client.host if request.client else "unknown"
-        current_time = time.time()
-        
-        # 清理过期记录
-        if client_ip in self.requests:
-            self.requests[client_ip] = [
-                (timestamp, count) for timestamp, count in self.requests[client_ip]
-                if current_time - timestamp < self.window_seconds
-            ]
+        now = time.monotonic()
+        cutoff = now - self.window_seconds
         
-        # 计算当前窗口内的请求数
-        if client_ip not in self.requests:
-            self.requests[client_ip] = []
+        timestamps = self.requests.get(client_ip)
+        if timestamps is None:
+            timestamps = self.requests[client_ip] = deque()
+            # 超出上限时淘汰最久未访问的IP
+            if len(self.requests) > self.max_tracked_ips:
+                self.requests.popitem(last=False)
+        else:
+            self.requests.move_to_end(client_ip)
         
-        current_requests = sum(count for _, count in self.requests[client_ip])
+        # 清理过期记录：时间戳有序，只需从队首弹出，摊还O(1)
+        while timestamps and timestamps[0] <= cutoff:
+            timestamps.popleft()
         
-        if current_requests >= self.max_requests:
+        if len(timestamps) >= self.max_requests:
             raise HTTPException(
                 status_code=429,
                 detail=f"Rate limit exceeded. Maximum {self.max_requests} requests per {self.window_seconds} seconds."
             )
         
         # 记录当前请求
-        self.requests[client_ip].append((current_time, 1))
+        timestamps.append(now)
+        return True
+    
+    def _sweep(self):
+        """移除窗口内已没有请求记录的IP"""
+        cutoff = time.monotonic() - self.window_seconds
+        stale = [ip for ip, timestamps in self.requests.items() if not timestamps or timestamps[-1] <= cutoff]
+        for ip in stale:
+            del self.requests[ip]
+    
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self._sweep()
+    
+    def start(self):
+        """启动后台清理任务（需在事件循环中调用）"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+    
+    async def stop(self):
+        """停止后台清理任务"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+
+class RedisRateLimiter:
+    """基于Redis的滑动窗口速率限制器（多worker共享状态）"""
+    
+    def __init__(self, redis, max_requests: int = 100, window_seconds: int = 3600):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self._window_ms = window_seconds * 1000
+        self._redis = redis
+        # register_script 使用 EVALSHA，脚本未缓存时自动回退到 EVAL
+        self._script = redis.register_script(_SLIDING_WINDOW_LUA)
+    
+    async def check_rate_limit(self, request: Request):
+        """检查速率限制"""
+        client_ip = request.client.host if request.client else "unknown"
+        now_ms = time.time_ns() // 1_000_000
+        
+        try:
+            remaining = await self._script(
+                keys=[f"rl:{client_ip}"],
+                args=[now_ms, self._window_ms, self.max_requests, f"{now_ms}-{uuid.uuid4().hex}"]
+            )
+        except RedisError as e:
+            # Redis不可用时放行请求，避免限流组件导致整个服务不可用
+            logger.warning(f"Rate limit check skipped, Redis unavailable: {str(e)}")
+            return True
+        
+        if remaining < 0:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded. Maximum {self.max_requests} requests per {self.window_seconds} seconds."
+            )
         
         return True
+    
+    def start(self):
+        """与进程内限流器保持一致的接口，Redis自行处理过期"""
+    
+    async def stop(self):
+        """关闭Redis连接"""
+        await self._redis.aclose()
 
 
-# 创建速率限制器实例
-rate_limiter = RateLimiter(max_requests=100, window_seconds=3600)  # 每小时100个请求
+# 创建速率限制器实例：配置了Redis时使用共享限流，否则使用进程内滑动窗口限流
+if redis_client is not None:
+    rate_limiter = RedisRateLimiter(
+        redis_client,
+        max_requests=settings.rate_limit_requests,
+        window_seconds=settings.rate_limit_window_seconds
+    )
+else:
+    rate_limiter = RateLimiter(
+        max_requests=settings.rate_limit_requests,
+        window_seconds=settings.rate_limit_window_seconds,
+        max_tracked_ips=settings.rate_limit_max_tracked_ips
+    )
 
 
 async def check_rate_limit(request: Request):
@@ -130,17 +318,71 @@ async def validate_request_size(request: Request):
     return True
 
 
+@dataclass(slots=True)
+class RequestContext:
+    """图片接口的请求上下文"""
+    base_url: str
+    user_id: Optional[str]
+    client_ip: str
+
+
+async def get_request_context(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+) -> RequestContext:
+    """图片接口的组合依赖
+    
+    在一个依赖中依次完成模型检查、请求大小校验、速率限制、认证和请求日志，
+    代替原先的六个独立依赖，减少FastAPI每次请求的依赖解析开销。
+    """
+    await verify_model_loaded()
+    await validate_request_size(request)
+    await rate_limiter.check_rate_limit(request)
+    user_id = await get_current_user(credentials)
+    
+    client_ip = request.client.host if request.client else "unknown"
+    user_agent = request.headers.get("user-agent", "unknown")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Request: %s %s - IP: %s - User: %s - UA: %s",
+            request.method, request.url.path, client_ip, user_id, user_agent
+        )
+    
+    return RequestContext(
+        base_url=get_base_url_from_request(request),
+        user_id=user_id,
+        client_ip=client_ip
+    )
+
+
+# GPU可用性和数量在进程内不变，导入时查询一次
+_GPU_AVAILABLE = torch.cuda.is_available()
+_GPU_COUNT = torch.cuda.device_count() if _GPU_AVAILABLE else 0
+
+
 class HealthChecker:
     """健康检查器"""
     
-    @staticmethod
-    async def check_model_health() -> dict:
+    # 显存统计的缓存时间（秒），避免高频探针每次都查询CUDA运行时
+    MEMORY_STATS_TTL = 0.5
+    
+    def __init__(self):
+        self._memory_stats: Tuple[int, int] = (0, 0)
+        self._memory_stats_at = float("-inf")
+    
+    def _get_memory_stats(self) -> Tuple[int, int]:
+        """获取 (已分配显存, 已保留显存)，带短时缓存"""
+        now = time.monotonic()
+        if now - self._memory_stats_at > self.MEMORY_STATS_TTL:
+            self._memory_stats = (torch.cuda.memory_allocated(), torch.cuda.memory_reserved())
+            self._memory_stats_at = now
+        return self._memory_stats
+    
+    async def check_model_health(self) -> dict:
         """检查模型健康状态"""
-        import torch
-        
         try:
             model_loaded = model_manager.is_loaded
-            gpu_available = torch.cuda.is_available()
+            gpu_available = _GPU_AVAILABLE
             
             # 如果模型已加载，尝试一个简单的推理测试
             if model_loaded:
@@ -151,12 +393,14 @@ class HealthChecker:
                     logger.warning(f"Model health check failed: {str(e)}")
                     model_loaded = False
             
+            memory_allocated, memory_reserved = self._get_memory_stats() if gpu_available else (0, 0)
+            
             return {
                 "model_loaded": model_loaded,
                 "gpu_available": gpu_available,
-                "gpu_count": torch.cuda.device_count() if gpu_available else 0,
-                "memory_allocated": torch.cuda.memory_allocated() if gpu_available else 0,
-                "memory_reserved": torch.cuda.memory_reserved() if gpu_available else 0
+                "gpu_count": _GPU_COUNT,
+                "memory_allocated": memory_allocated,
+                "memory_reserved": memory_reserved
             }
             
         except Exception as e:
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, Request, HTTPException
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 import logging
 
 from app.models.schemas import (
@@ -10,14 +10,7 @@ from app.models.schemas import (
     ErrorResponse
 )
 from app.services.image_service import image_service
-from app.api.dependencies import (
-    verify_model_loaded,
-    get_base_url,
-    get_current_user,
-    check_rate_limit,
-    validate_request_size,
-    log_request
-)
+from app.api.dependencies import RequestContext, get_request_context
 from app.core.exceptions import APIException
 
 logger = logging.getLogger(__name__)
@@ -39,13 +32,7 @@ router = APIRouter(prefix="/images", tags=["images"])
 )
 async def generate_images(
     request_data: ImageGenerationRequest,
-    request: Request,
-    base_url: str = Depends(get_base_url),
-    user_id: Optional[str] = Depends(get_current_user),
-    _: bool = Depends(verify_model_loaded),
-    __: bool = Depends(check_rate_limit),
-    ___: bool = Depends(validate_request_size),
-    ____: dict = Depends(log_request)
+    ctx: RequestContext = Depends(get_request_context)
 ):
     """生成图片
     
@@ -62,13 +49,14 @@ async def generate_images(
     """
     try:
         # 设置用户ID
-        if user_id:
-            request_data.user = user_id
+        if ctx.user_id:
+            request_data.user = ctx.user_id
         
         # 调用图片生成服务
-        result = await image_service.generate_images(request_data, base_url)
+        result = await image_service.generate_images(request_data, ctx.base_url)
         
-        return result
+        # 直接返回orjson序列化的响应，跳过FastAPI按response_model的二次校验和jsonable_encoder转换
+        return ORJSONResponse(result.model_dump())
         
     except APIException:
         raise
@@ -92,13 +80,7 @@ async def generate_images(
 )
 async def edit_image(
     request_data: ImageEditRequest,
-    request: Request,
-    base_url: str = Depends(get_base_url),
-    user_id: Optional[str] = Depends(get_current_user),
-    _: bool = Depends(verify_model_loaded),
-    __: bool = Depends(check_rate_limit),
-    ___: bool = Depends(validate_request_size),
-    ____: dict = Depends(log_request)
+    ctx: RequestContext = Depends(get_request_context)
 ):
     """编辑图片
     
@@ -115,13 +97,14 @@ async def edit_image(
     """
     try:
         # 设置用户ID
-        if user_id:
-            request_data.user = user_id
+        if ctx.user_id:
+            request_data.user = ctx.user_id
         
         # 调用图片编辑服务
-        result = await image_service.edit_image(request_data, base_url)
+        result = await image_service.edit_image(request_data, ctx.base_url)
         
-        return result
+        # 直接返回orjson序列化的响应，跳过FastAPI按response_model的二次校验和jsonable_encoder转换
+        return ORJSONResponse(result.model_dump())
         
     except APIException:
         raise
@@ -145,13 +128,7 @@ async def edit_image(
 )
 async def generate_variations(
     request_data: ImageVariationRequest,
-    request: Request,
-    base_url: str = Depends(get_base_url),
-    user_id: Optional[str] = Depends(get_current_user),
-    _: bool = Depends(verify_model_loaded),
-    __: bool = Depends(check_rate_limit),
-    ___: bool = Depends(validate_request_size),
-    ____: dict = Depends(log_request)
+    ctx: RequestContext = Depends(get_request_context)
 ):
     """生成图片变体
     
@@ -168,13 +145,14 @@ async def generate_variations(
     """
     try:
         # 设置用户ID
-        if user_id:
-            request_data.user = user_id
+        if ctx.user_id:
+            request_data.user = ctx.user_id
         
         # 调用图片变体生成服务
-        result = await image_service.generate_variations(request_data, base_url)
+        result = await image_service.generate_variations(request_data, ctx.base_url)
         
-        return result
+        # 直接返回orjson序列化的响应，跳过FastAPI按response_model的二次校验和jsonable_encoder转换
+        return ORJSONResponse(result.model_dump())
         
     except APIException:
         raise
@@ -1,15 +1,35 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import Response
+from functools import lru_cache
+from typing import Optional, Tuple
+import orjson
+import psutil
+import torch
 import time
 import logging
 
 from app.models.schemas import ModelsResponse, ModelInfo, HealthResponse
-from app.api.dependencies import health_checker
+from app.api.dependencies import health_checker, _GPU_AVAILABLE, _GPU_COUNT
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["models"])
 
+# 模型信息在进程生命周期内不变，导入时预先序列化，请求时直接返回字节
+_MODEL_INFO = {
+    "id": "flux-1-kontext-dev",
+    "object": "model",
+    "created": int(time.time()),
+    "owned_by": "black-forest-labs"
+}
+_MODEL_PAYLOAD = orjson.dumps(_MODEL_INFO)
+_MODELS_PAYLOAD = orjson.dumps({"object": "list", "data": [_MODEL_INFO]})
+
+# 详细健康信息的缓存 (生成时间, 内容)，负载均衡/存活探针高频访问时避免重复的系统调用和CUDA查询
+_DETAILED_HEALTH_TTL = 1.0
+_detailed_health_cache: Tuple[float, Optional[dict]] = (0.0, None)
+
 
 @router.get(
     "/models",
@@ -25,19 +45,7 @@ async def list_models():
     Returns:
         ModelsResponse: 包含模型列表的响应对象
     """
-    models = [
-        ModelInfo(
-            id="flux-1-kontext-dev",
-            object="model",
-            created=int(time.time()),
-            owned_by="black-forest-labs"
-        )
-    ]
-    
-    return ModelsResponse(
-        object="list",
-        data=models
-    )
+    return Response(content=_MODELS_PAYLOAD, media_type="application/json")
 
 
 @router.get(
@@ -58,16 +66,9 @@ async def get_model(model_id: str):
     Raises:
         HTTPException: 当模型ID不存在时返回404错误
     """
-    from fastapi import HTTPException
-    
     # 目前只支持一个模型
-    if model_id == "flux-1-kontext-dev":
-        return ModelInfo(
-            id="flux-1-kontext-dev",
-            object="model",
-            created=int(time.time()),
-            owned_by="black-forest-labs"
-        )
+    if model_id == _MODEL_INFO["id"]:
+        return Response(content=_MODEL_PAYLOAD, media_type="application/json")
     else:
         raise HTTPException(
             status_code=404,
@@ -126,50 +127,16 @@ async def detailed_health_check():
     Returns:
         dict: 详细的健康状态信息
     """
+    global _detailed_health_cache
+    
+    cached_at, payload = _detailed_health_cache
+    if payload is not None and time.monotonic() - cached_at < _DETAILED_HEALTH_TTL:
+        return payload
+    
     try:
-        import torch
-        import psutil
-        
-        # 获取基本健康信息
-        health_info = await health_checker.check_model_health()
-        
-        # 添加系统信息
-        system_info = {
-            "cpu_percent": psutil.cpu_percent(),
-            "memory_percent": psutil.virtual_memory().percent,
-            "disk_percent": psutil.disk_usage('/').percent
-        }
-        
-        # 添加GPU详细信息
-        gpu_info = {}
-        if torch.cuda.is_available():
-            gpu_info = {
-                "gpu_count": torch.cuda.device_count(),
-                "current_device": torch.cuda.current_device(),
-                "device_name": torch.cuda.get_device_name(),
-                "memory_allocated_mb": torch.cuda.memory_allocated() / 1024 / 1024,
-                "memory_reserved_mb": torch.cuda.memory_reserved() / 1024 / 1024,
-                "memory_total_mb": torch.cuda.get_device_properties(0).total_memory / 1024 / 1024
-            }
-        
-        return {
-            "status": "healthy" if health_info.get("model_loaded", False) else "unhealthy",
-            "timestamp": int(time.time()),
-            "version": settings.app_version,
-            "model": {
-                "name": settings.model_name,
-                "loaded": health_info.get("model_loaded", False),
-                "device": settings.device
-            },
-            "system": system_info,
-            "gpu": gpu_info,
-            "settings": {
-                "max_batch_size": settings.max_batch_size,
-                "max_image_size": settings.max_image_size,
-                "default_guidance_scale": settings.default_guidance_scale,
-                "default_num_inference_steps": settings.default_num_inference_steps
-            }
-        }
+        payload = await _gather_detailed_health()
+        _detailed_health_cache = (time.monotonic(), payload)
+        return payload
         
     except Exception as e:
         logger.error(f"Detailed health check failed: {str(e)}")
@@ -181,6 +148,58 @@ async def detailed_health_check():
         }
 
 
+@lru_cache(maxsize=1)
+def _gpu_static_info() -> dict:
+    """GPU的静态属性，进程内不会变化，只查询一次"""
+    return {
+        "gpu_count": _GPU_COUNT,
+        "device_name": torch.cuda.get_device_name(),
+        "memory_total_mb": torch.cuda.get_device_properties(0).total_memory / 1024 / 1024
+    }
+
+
+async def _gather_detailed_health() -> dict:
+    """采集详细健康信息"""
+    # 获取基本健康信息
+    health_info = await health_checker.check_model_health()
+    
+    # 添加系统信息
+    system_info = {
+        "cpu_percent": psutil.cpu_percent(),
+        "memory_percent": psutil.virtual_memory().percent,
+        "disk_percent": psutil.disk_usage('/').percent
+    }
+    
+    # 添加GPU详细信息
+    gpu_info = {}
+    if _GPU_AVAILABLE:
+        gpu_info = {
+            **_gpu_static_info(),
+            "current_device": torch.cuda.current_device(),
+            "memory_allocated_mb": torch.cuda.memory_allocated() / 1024 / 1024,
+            "memory_reserved_mb": torch.cuda.memory_reserved() / 1024 / 1024
+        }
+    
+    return {
+        "status": "healthy" if health_info.get("model_loaded", False) else "unhealthy",
+        "timestamp": int(time.time()),
+        "version": settings.app_version,
+        "model": {
+            "name": settings.model_name,
+            "loaded": health_info.get("model_loaded", False),
+            "device": settings.device
+        },
+        "system": system_info,
+        "gpu": gpu_info,
+        "settings": {
+            "max_batch_size": settings.max_batch_size,
+            "max_image_size": settings.max_image_size,
+            "default_guidance_scale": settings.default_guidance_scale,
+            "default_num_inference_steps": settings.default_num_inference_steps
+        }
+    }
+
+
 # 添加文档示例
 list_models.__doc__ += """
 
@@ -1,6 +1,8 @@
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 import os
+import redis.asyncio as aioredis
 
 
 class Settings(BaseSettings):
@@ -19,6 +21,13 @@ class Settings(BaseSettings):
     model_name: str = "~/.cache/modelscope/hub/black-forest-labs/FLUX.1-Kontext-dev"
     device: str = "cuda"
     torch_dtype: str = "bfloat16"
+    warmup_on_startup: bool = True  # 模型加载后立即执行预热推理
+    quantization: Literal["none", "int8", "fp8"] = "none"  # transformer权重量化：none / int8 / fp8（需要安装torchao）
+    prompt_embed_cache_size: int = 32  # 缓存的提示词编码数量（缓存驻留显存，每条约4MB）
+    torch_compile: bool = False  # 使用torch.compile(reduce-overhead/CUDA Graphs)编译transformer和VAE解码
+    # CUDA显存分配器配置：默认使用原生缓存分配器的可扩展段；也可设为"backend:cudaMallocAsync"
+    # （cudaMallocAsync不支持expandable_segments，也不能与torch_compile的CUDA Graphs同时使用）
+    cuda_alloc_conf: str = "expandable_segments:True"
     
     # 图片配置
     max_image_size: int = 2048
@@ -36,6 +45,13 @@ class Settings(BaseSettings):
     upload_dir: str = "static/uploads"
     output_dir: str = "static/outputs"
     
+    # 输出图片存储（url响应格式）：local 写入 output_dir；s3 上传到对象存储并返回预签名URL
+    storage_backend: str = "local"
+    s3_bucket: Optional[str] = None
+    s3_prefix: str = "outputs/"
+    s3_endpoint_url: Optional[str] = None  # 兼容S3的对象存储（如MinIO）
+    s3_presign_expires: int = 3600  # 预签名URL有效期（秒）
+    
     # API配置
     api_v1_prefix: str = "/v1"
     cors_origins: list = ["*"]
@@ -44,14 +60,54 @@ class Settings(BaseSettings):
     max_file_size: int = 10 * 1024 * 1024  # 10MB
     allowed_image_types: list = ["image/jpeg", "image/png", "image/webp"]
     
+    # 速率限制配置
+    redis_url: Optional[str] = None  # 未配置时使用进程内滑动窗口限流
+    redis_socket_timeout: float = 0.5  # Redis连接与读写超时（秒），避免Redis不可用时阻塞请求
+    rate_limit_requests: int = 100
+    rate_limit_window_seconds: int = 3600
+    rate_limit_max_tracked_ips: int = 100_000  # 进程内限流器最多跟踪的IP数
+    
+    # 日志配置
+    log_level: str = "INFO"
+    log_file: Optional[str] = "logs/app.log"
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
+    
+    @model_validator(mode='after')
+    def check_cuda_allocator(self):
+        """cudaMallocAsync没有reduce-overhead模式CUDA Graphs依赖的显存池检查点/恢复"""
+        if self.torch_compile and "cudaMallocAsync" in self.cuda_alloc_conf:
+            raise ValueError("CUDA_ALLOC_CONF with backend:cudaMallocAsync cannot be combined with TORCH_COMPILE")
+        return self
 
 
 # 创建全局设置实例
 settings = Settings()
 
+def configure_cuda_allocator() -> Optional[str]:
+    """设置PYTORCH_CUDA_ALLOC_CONF
+    
+    PyTorch在加载CUDA库时确定分配器后端，因此必须在任何模块导入torch之前调用。
+    环境中已设置不同的值时以用户设置为准，并返回该值供调用方记录告警。
+    """
+    if settings.device != "cuda":
+        return None
+    current = os.environ.get("PYTORCH_CUDA_ALLOC_CONF")
+    if current is None:
+        os.environ["PYTORCH_CUDA_ALLOC_CONF"] = settings.cuda_alloc_conf
+        return None
+    return current if current != settings.cuda_alloc_conf else None
+
+
+# 全局Redis客户端（连接在首次使用时建立，未配置REDIS_URL时为None）
+redis_client = aioredis.from_url(
+    settings.redis_url,
+    socket_connect_timeout=settings.redis_socket_timeout,
+    socket_timeout=settings.redis_socket_timeout,
+) if settings.redis_url else None
+
 # 确保必要的目录存在
 os.makedirs(settings.upload_dir, exist_ok=True)
 os.makedirs(settings.output_dir, exist_ok=True)
\ No newline at end of file
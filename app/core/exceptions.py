@@ -1,7 +1,9 @@
 from fastapi import HTTPException, Request
-from fastapi.responses import JSONResponse
-from typing import Any, Dict
+from fastapi.responses import Response
+from functools import lru_cache
+from typing import Any, Dict, Tuple
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
@@ -56,33 +58,37 @@ class InvalidParameters(APIException):
         super().__init__(status_code=422, detail=detail, error_code="INVALID_PARAMETERS")
 
 
-async def api_exception_handler(request: Request, exc: APIException) -> JSONResponse:
+@lru_cache(maxsize=64)
+def _error_template(error_type: str, code: int) -> Tuple[bytes, bytes]:
+    """按(type, code)缓存错误响应JSON中message前后的固定部分"""
+    prefix = b'{"error":{"message":'
+    suffix = b',"type":' + orjson.dumps(error_type) + b',"code":' + str(code).encode() + b'}}'
+    return prefix, suffix
+
+
+def format_error_response_bytes(message: str, error_type: str = "api_error", code: int = 400) -> bytes:
+    """生成序列化后的错误响应体，与 {"error": {"message", "type", "code"}} 结构一致，只需转义message"""
+    prefix, suffix = _error_template(error_type, code)
+    return prefix + orjson.dumps(message) + suffix
+
+
+def _error_response(message: str, error_type: str, code: int) -> Response:
+    return Response(
+        content=format_error_response_bytes(message, error_type, code),
+        status_code=code,
+        media_type="application/json"
+    )
+
+
+async def api_exception_handler(request: Request, exc: APIException) -> Response:
     """API异常处理器"""
-    logger.error(f"API Exception: {exc.detail} (Code: {exc.error_code})")
+    logger.error("API Exception: %s (Code: %s)", exc.detail, exc.error_code)
     
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={
-            "error": {
-                "message": exc.detail,
-                "type": exc.error_code or "api_error",
-                "code": exc.status_code
-            }
-        }
-    )
+    return _error_response(exc.detail, exc.error_code or "api_error", exc.status_code)
 
 
-async def general_exception_handler(request: Request, exc: Exception) -> JSONResponse:
+async def general_exception_handler(request: Request, exc: Exception) -> Response:
     """通用异常处理器"""
     logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
     
-    return JSONResponse(
-        status_code=500,
-        content={
-            "error": {
-                "message": "Internal server error",
-                "type": "internal_error",
-                "code": 500
-            }
-        }
-    )
\ No newline at end of file
+    return _error_response("Internal server error", "internal_error", 500)
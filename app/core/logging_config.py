@@ -0,0 +1,154 @@
+import io
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from app.core.config import settings
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 底层写缓冲大小，使内核看到的是约64KB的大块写入
+_WRITE_BUFFER_SIZE = 64 * 1024
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """只负责入队的日志处理器
+
+    格式化交给后台监听线程完成；队列积压时直接丢弃记录，保证不会阻塞事件循环。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同进程队列无需序列化，跳过默认实现中的格式化
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class BatchingHandler(logging.Handler):
+    """批量写入的日志处理器
+
+    emit 只把格式化后的文本追加到内存列表，累计 batch_size 条后一次性写入缓冲流；
+    后台线程每 flush_interval 秒把剩余记录写出并刷新到内核，保证低流量时日志也能及时落盘。
+    """
+
+    def __init__(self, stream: io.BufferedWriter, batch_size: int = 64, flush_interval: float = 0.05):
+        super().__init__()
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="log-flusher", daemon=True)
+        self._flusher.start()
+
+    def emit(self, record: logging.LogRecord):
+        # Handler.handle 已持有 self.lock
+        try:
+            self._buffer.append(self.format(record) + "\n")
+            if len(self._buffer) >= self.batch_size:
+                self._drain()
+        except Exception:
+            self.handleError(record)
+
+    def _drain(self):
+        """把累积的记录写入缓冲流（缓冲区满时由BufferedWriter自行写到内核）"""
+        if self._buffer:
+            self.stream.write("".join(self._buffer).encode("utf-8", "replace"))
+            self._buffer.clear()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._drain()
+            self.stream.flush()
+        finally:
+            self.release()
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            # 限时取锁：logging.shutdown 会持有锁调用 close，阻塞取锁会与 close 中的 join 互相等待
+            if not self.lock.acquire(timeout=self.flush_interval):
+                continue
+            try:
+                if not self._stopped.is_set():
+                    self._drain()
+                    self.stream.flush()
+            except Exception:
+                pass
+            finally:
+                self.lock.release()
+
+    def close(self):
+        self._stopped.set()
+        self._flusher.join(timeout=1.0)
+        try:
+            self.flush()
+            self.stream.close()
+        finally:
+            super().close()
+
+
+class RotatingBatchingHandler(BatchingHandler):
+    """按大小轮转的批量文件日志处理器（轮转规则与RotatingFileHandler一致）"""
+
+    def __init__(self, filename: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 5, **kwargs):
+        self.filename = os.path.abspath(filename)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        super().__init__(self._open(), **kwargs)
+
+    def _open(self) -> io.BufferedWriter:
+        return open(self.filename, "ab", buffering=_WRITE_BUFFER_SIZE)
+
+    def _drain(self):
+        super()._drain()
+        if self.max_bytes > 0 and self.stream.tell() >= self.max_bytes:
+            self._rollover()
+
+    def _rollover(self):
+        self.stream.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.filename}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.filename}.{i + 1}")
+            os.replace(self.filename, f"{self.filename}.1")
+        else:
+            open(self.filename, "wb").close()
+        self.stream = self._open()
+
+
+def setup_logging() -> QueueListener:
+    """配置异步日志，返回已启动的QueueListener（关闭时需调用stop）"""
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    # 控制台：包装stderr的文件描述符，不接管其生命周期
+    console_stream = io.BufferedWriter(
+        io.FileIO(sys.stderr.fileno(), "wb", closefd=False),
+        buffer_size=_WRITE_BUFFER_SIZE
+    )
+    handlers = [BatchingHandler(console_stream)]
+
+    if settings.log_file:
+        os.makedirs(os.path.dirname(settings.log_file) or ".", exist_ok=True)
+        handlers.append(RotatingBatchingHandler(settings.log_file))
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=10000)
+
+    root = logging.getLogger()
+    root.setLevel(settings.log_level.upper())
+    root.handlers = [_NonBlockingQueueHandler(log_queue)]
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -1,39 +1,56 @@
+# CUDA显存分配器配置必须在任何模块导入torch之前写入环境变量
+from app.core.config import settings, configure_cuda_allocator
+_conflicting_alloc_conf = configure_cuda_allocator()
+
+import asyncio
 import logging
 import os
+import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 import uvicorn
 
-from app.core.config import settings
+from app.core.logging_config import setup_logging
 from app.core.exceptions import (
     APIException,
     api_exception_handler,
     general_exception_handler
 )
 from app.api.v1 import api_router
+from app.api.dependencies import rate_limiter
 from app.models.flux_model import model_manager
+from app.services.image_service import image_service
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 配置日志：请求路径上只做入队，写入由后台线程完成
+log_listener = setup_logging()
 logger = logging.getLogger(__name__)
 
+if _conflicting_alloc_conf is not None:
+    # 以用户显式设置的环境变量为准
+    logger.warning(
+        f"PYTORCH_CUDA_ALLOC_CONF already set to {_conflicting_alloc_conf!r}, "
+        f"ignoring configured value {settings.cuda_alloc_conf!r}"
+    )
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时的操作
     logger.info("Starting FLUX.1-Kontext API...")
+    rate_limiter.start()
+    
+    # 启动时生成并缓存OpenAPI schema（FastAPI会复用app.openapi_schema），避免首个文档请求承担生成开销
+    app.openapi()
     
     try:
-        # 主动加载模型
+        # 主动加载模型（加载完成后会按配置执行预热推理）
+        # 在GPU工作线程中执行：reduce-overhead模式的CUDA Graphs按线程录制，预热需与推理在同一线程
         logger.info("Preloading FLUX model...")
-        model_manager.load_model()
+        await asyncio.get_running_loop().run_in_executor(image_service.executor, model_manager.load_model)
         logger.info("Model preloading completed")
         
         logger.info("API startup completed")
@@ -47,6 +64,8 @@ async def lifespan(app: FastAPI):
     
     # 关闭时的操作
     logger.info("Shutting down FLUX.1-Kontext API...")
+    await rate_limiter.stop()
+    log_listener.stop()
 
 
 # 创建FastAPI应用
@@ -66,7 +85,7 @@ app = FastAPI(
     ## 支持的图片格式
     
     * 输入: JPEG, PNG, WebP
-    * 输出: PNG (URL或base64)
+    * 输出: PNG（默认）、JPEG、WebP，通过output_format指定 (URL或base64)
     
     ## 速率限制
     
@@ -77,6 +96,7 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -119,11 +139,17 @@ async def ping():
     return {"status": "ok", "message": "pong"}
 
 
+# 固定的安全响应头
+_SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block"
+}
+
+
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """请求日志中间件"""
-    import time
-    
+async def process_request(request: Request, call_next):
+    """请求日志与安全头中间件（合并为一层，减少每个请求的中间件调用开销）"""
     start_time = time.time()
     
     # 处理请求
@@ -132,28 +158,17 @@ async def log_requests(request: Request, call_next):
     # 计算处理时间
     process_time = time.time() - start_time
     
-    # 记录请求日志
-    logger.info(
-        f"{request.method} {request.url.path} - "
-        f"Status: {response.status_code} - "
-        f"Time: {process_time:.3f}s"
-    )
-    
-    # 添加处理时间到响应头
-    response.headers["X-Process-Time"] = str(process_time)
-    
-    return response
-
-
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    """安全头中间件"""
-    response = await call_next(request)
+    # 记录请求日志（参数延迟到日志线程格式化，级别关闭时不做任何格式化）
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "%s %s - Status: %d - Time: %.3fs",
+            request.method, request.url.path, response.status_code, process_time
+        )
     
-    # 添加安全头
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
+    # 添加处理时间和安全头
+    headers = response.headers
+    headers["X-Process-Time"] = str(process_time)
+    headers.update(_SECURITY_HEADERS)
     
     return response
 
@@ -165,5 +180,8 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=settings.debug,
-        log_level="info"
+        loop="uvloop",
+        http="httptools",
+        log_config=None,  # 沿用应用的异步日志配置
+        log_level=settings.log_level.lower()
     )
\ No newline at end of file
@@ -1,8 +1,9 @@
 import torch
+import functools
 import logging
 import threading
 import os
-from typing import List, Optional
+from typing import List, Optional, Tuple, Union
 from PIL import Image
 import numpy as np
 from diffusers import FluxKontextPipeline
@@ -11,69 +12,119 @@ from app.core.exceptions import ModelLoadError, GenerationError
 
 logger = logging.getLogger(__name__)
 
+# 随机种子取值范围为32位无符号整数
+_SEED_MASK = 0xFFFFFFFF
+
 
 class FluxModelManager:
-    """FLUX模型管理器 - 单例模式"""
-    
-    _instance = None
-    _pipeline = None
-    _model_loaded = False
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(FluxModelManager, cls).__new__(cls)
-        return cls._instance
+    """FLUX模型管理器（通过模块级实例 model_manager 使用）"""
     
     def __init__(self):
-        if not hasattr(self, 'initialized'):
-            self.initialized = True
-            self._lock = threading.Lock()
-            # 延迟加载模型，不在初始化时加载
-            logger.info("FluxModelManager initialized, model will be loaded on first use")
+        self._pipeline = None
+        # 普通属性而非property：每个请求都会读取，模型加载完成后不再变化
+        self.is_loaded = False
+        self._warmed_up = False
+        self._lock = threading.Lock()
+        # 每个推理线程复用的随机数生成器
+        self._local = threading.local()
+        # 相同提示词的文本编码结果（T5+CLIP）直接复用，跳过文本编码器前向
+        self._encode_prompt_cached = functools.lru_cache(maxsize=settings.prompt_embed_cache_size)(
+            self._encode_prompt
+        )
+        # 延迟加载模型，不在初始化时加载
+        logger.info("FluxModelManager initialized, model will be loaded on first use")
     
     def _ensure_model_loaded(self):
         """确保模型已加载"""
-        if not self.is_loaded:
-            with self._lock:
-                if not self.is_loaded:  # 双重检查
-                    self._load_model()
+        # 快速路径：模型加载后只有一次属性读取，不进入锁
+        if self.is_loaded:
+            return
+        with self._lock:
+            if not self.is_loaded:  # 双重检查
+                self._load_model()
+                # 加载后立即预热，无论由启动流程还是首个请求触发加载
+                if settings.warmup_on_startup:
+                    self.warmup()
     
     def _load_model(self):
         """加载FLUX模型"""
         try:
             logger.info(f"Loading FLUX model: {settings.model_name}")
             
+            use_cuda = torch.cuda.is_available() and settings.device == "cuda"
+            
             # 设置torch数据类型
             torch_dtype = getattr(torch, settings.torch_dtype)
             
             # 展开用户目录路径
             model_path = os.path.expanduser(settings.model_name)
             
-            # 加载模型
-            self._pipeline = FluxKontextPipeline.from_pretrained(
-                model_path,
-                torch_dtype=torch_dtype
-            )
-            
-            # 移动到指定设备
-            if torch.cuda.is_available() and settings.device == "cuda":
-                self._pipeline = self._pipeline.to("cuda")
+            if use_cuda:
+                # 权重分片直接加载到GPU，避免先在CPU上完整加载一份再整体拷贝
+                self._pipeline = FluxKontextPipeline.from_pretrained(
+                    model_path,
+                    torch_dtype=torch_dtype,
+                    device_map="cuda",
+                    low_cpu_mem_usage=True
+                )
                 logger.info("Model loaded on CUDA")
+                # 允许fp32矩阵乘和卷积使用TF32张量核心（bf16/fp16路径不受影响）
+                torch.backends.cuda.matmul.allow_tf32 = True
+                torch.backends.cudnn.allow_tf32 = True
+                if settings.quantization != "none":
+                    self._quantize_transformer(settings.quantization)
+                if settings.torch_compile:
+                    self._compile_pipeline()
             else:
-                self._pipeline = self._pipeline.to("cpu")
+                self._pipeline = FluxKontextPipeline.from_pretrained(
+                    model_path,
+                    torch_dtype=torch_dtype
+                ).to("cpu")
                 logger.info("Model loaded on CPU")
+                if settings.quantization != "none":
+                    logger.warning(f"Quantization {settings.quantization!r} is only applied on CUDA, ignored on CPU")
             
-            self._model_loaded = True
+            self.is_loaded = True
             logger.info("FLUX model loaded successfully")
             
         except Exception as e:
             logger.error(f"Failed to load FLUX model: {str(e)}")
             raise ModelLoadError(f"Failed to load model: {str(e)}")
     
-    @property
-    def is_loaded(self) -> bool:
-        """检查模型是否已加载"""
-        return self._model_loaded and self._pipeline is not None
+    def _quantize_transformer(self, mode: str):
+        """使用torchao对transformer做权重量化（VAE保持原精度，对量化误差较敏感）"""
+        try:
+            from torchao.quantization import (
+                quantize_,
+                int8_weight_only,
+                Float8DynamicActivationFloat8WeightConfig,
+            )
+        except ImportError:
+            raise ModelLoadError("torchao is required for quantization, install it with: pip install torchao")
+        
+        if mode == "int8":
+            config = int8_weight_only()
+        elif mode == "fp8":
+            config = Float8DynamicActivationFloat8WeightConfig()
+        else:
+            raise ModelLoadError(f"Unsupported quantization mode: {mode}, expected none, int8 or fp8")
+        
+        logger.info(f"Quantizing transformer weights: {mode}")
+        quantize_(self._pipeline.transformer, config)
+    
+    def _compile_pipeline(self):
+        """编译transformer和VAE解码
+        
+        reduce-overhead模式通过CUDA Graphs重放内核序列，消除每个去噪步的内核启动开销；
+        编译在首次推理（预热）时按实际输入形状进行，新的图片尺寸会触发重新编译。
+        """
+        logger.info("Compiling transformer and VAE decoder with torch.compile (reduce-overhead)")
+        self._pipeline.transformer = torch.compile(
+            self._pipeline.transformer, mode="reduce-overhead", fullgraph=False
+        )
+        self._pipeline.vae.decode = torch.compile(
+            self._pipeline.vae.decode, mode="reduce-overhead", fullgraph=False
+        )
     
     @property
     def pipeline(self):
@@ -91,6 +142,92 @@ class FluxModelManager:
         else:
             logger.info("Model already loaded")
     
+    @torch.inference_mode()
+    def warmup(self):
+        """预热模型（只执行一次）
+        
+        分别对纯文本生成和带输入图片的编辑路径执行一次单步推理，覆盖VAE编码和解码：
+        cuDNN/cuBLAS算法选择、kernel加载以及CUDA缓存分配器为各阶段显存扩容等一次性开销
+        都发生在启动阶段，首个请求即可复用已缓存的显存块。
+        """
+        self._ensure_model_loaded()
+        if self._warmed_up:
+            return
+        
+        if self._pipeline.device.type == "cuda":
+            # 让cuDNN为实际使用的输入形状选择最快的算法（调优在预热时完成）
+            torch.backends.cudnn.benchmark = True
+        
+        try:
+            logger.info("Warming up FLUX pipeline...")
+            size = settings.default_image_size
+            
+            # 文生图路径
+            self._pipeline(
+                prompt="warmup",
+                width=size,
+                height=size,
+                guidance_scale=settings.default_guidance_scale,
+                num_inference_steps=1
+            )
+            
+            # 图片编辑路径（额外经过VAE编码，序列长度也不同）
+            warmup_image = Image.new("RGB", (size, size), (255, 255, 255))
+            self._pipeline(
+                image=warmup_image,
+                prompt="warmup",
+                width=size,
+                height=size,
+                guidance_scale=settings.default_guidance_scale,
+                num_inference_steps=1
+            )
+            
+            if self._pipeline.device.type == "cuda":
+                torch.cuda.synchronize()
+            self._warmed_up = True
+            logger.info("Pipeline warmup completed")
+        except Exception as e:
+            logger.warning(f"Pipeline warmup failed: {str(e)}")
+    
+    def _make_generators(self, seed: Optional[int], num_images: int) -> Optional[List[torch.Generator]]:
+        """为批次中的每张图片准备独立种子的生成器（第i张使用 seed+i，与逐张生成时一致）
+        
+        生成器按线程缓存复用，每次只重新设置种子，避免每次请求都在设备上新建生成器和初始化随机状态。
+        """
+        if seed is None:
+            return None
+        
+        generators = getattr(self._local, "generators", None)
+        if generators is None:
+            generators = self._local.generators = []
+        while len(generators) < num_images:
+            generators.append(torch.Generator(device=self._pipeline.device))
+        
+        # 取低32位保证种子值在有效范围内 (0 到 2^32-1)
+        for i in range(num_images):
+            generators[i].manual_seed((seed + i) & _SEED_MASK)
+        return generators[:num_images]
+    
+    def _encode_prompt(self, prompt: str) -> Tuple[torch.Tensor, torch.Tensor]:
+        """编码单条提示词，返回 (prompt_embeds, pooled_prompt_embeds)"""
+        prompt_embeds, pooled_prompt_embeds, _ = self._pipeline.encode_prompt(
+            prompt=prompt,
+            prompt_2=None,
+            device=self._pipeline.device,
+            num_images_per_prompt=1
+        )
+        return prompt_embeds, pooled_prompt_embeds
+    
+    def _prompt_embeds(self, prompts: List[str]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """获取一组提示词的文本编码（逐条走缓存后按批次拼接）"""
+        encoded = [self._encode_prompt_cached(p) for p in prompts]
+        if len(encoded) == 1:
+            return encoded[0]
+        return (
+            torch.cat([e[0] for e in encoded]),
+            torch.cat([e[1] for e in encoded])
+        )
+    
     def generate_image(
         self,
         prompt: str,
@@ -102,29 +239,40 @@ class FluxModelManager:
         **kwargs
     ) -> Image.Image:
         """生成图片"""
+        return self.generate_image_batch(
+            prompt, width, height, 1, guidance_scale, num_inference_steps, seed, **kwargs
+        )[0]
+    
+    @torch.inference_mode()
+    def generate_image_batch(
+        self,
+        prompt: str,
+        width: int = 1024,
+        height: int = 1024,
+        num_images: int = 1,
+        guidance_scale: float = 2.5,
+        num_inference_steps: int = 28,
+        seed: Optional[int] = None,
+        **kwargs
+    ) -> List[Image.Image]:
+        """批量生成图片：一次管道调用生成num_images张，每个去噪步只做一次批量前向"""
         self._ensure_model_loaded()
         
         try:
-            # 设置随机种子
-            generator = None
-            if seed is not None:
-                # 确保种子值在有效范围内 (0 到 2^32-1)
-                safe_seed = abs(seed) % (2**32)
-                generator = torch.Generator(device=self._pipeline.device)
-                generator.manual_seed(safe_seed)
-            
-            # 生成图片
+            # 预先计算的文本编码不会被管道按num_images_per_prompt复制，这里直接构造num_images行
+            prompt_embeds, pooled_prompt_embeds = self._prompt_embeds([prompt] * num_images)
             result = self._pipeline(
-                prompt=prompt,
+                prompt_embeds=prompt_embeds,
+                pooled_prompt_embeds=pooled_prompt_embeds,
                 width=width,
                 height=height,
                 guidance_scale=guidance_scale,
                 num_inference_steps=num_inference_steps,
-                generator=generator,
+                generator=self._make_generators(seed, num_images),
                 **kwargs
             )
             
-            return result.images[0]
+            return result.images
             
         except Exception as e:
             logger.error(f"Image generation failed: {str(e)}")
@@ -140,43 +288,55 @@ class FluxModelManager:
         **kwargs
     ) -> Image.Image:
         """编辑图片"""
+        return self.edit_image_batch(
+            image, prompt, 1, guidance_scale, num_inference_steps, seed, **kwargs
+        )[0]
+    
+    @torch.inference_mode()
+    def edit_image_batch(
+        self,
+        image: Image.Image,
+        prompt: str,
+        num_images: int = 1,
+        guidance_scale: float = 2.5,
+        num_inference_steps: int = 28,
+        seed: Optional[int] = None,
+        **kwargs
+    ) -> List[Image.Image]:
+        """批量编辑图片：同一输入图片和指令，一次管道调用生成num_images个结果"""
         self._ensure_model_loaded()
         
         try:
-            # 确保图片为RGB格式
+            # 确保图片为RGB格式（以PIL传入，管道按目标分辨率做Lanczos缩放）
             if image.mode != 'RGB':
                 image = image.convert('RGB')
+            width, height = image.size
             
-            # 设置随机种子
-            generator = None
-            if seed is not None:
-                # 确保种子值在有效范围内 (0 到 2^32-1)
-                safe_seed = abs(seed) % (2**32)
-                generator = torch.Generator(device=self._pipeline.device)
-                generator.manual_seed(safe_seed)
-            
-            # 编辑图片
+            # 预先计算的文本编码不会被管道按num_images_per_prompt复制，这里直接构造num_images行
+            prompt_embeds, pooled_prompt_embeds = self._prompt_embeds([prompt] * num_images)
             result = self._pipeline(
                 image=image,
-                prompt=prompt,
-                width=image.size[0],
-                height=image.size[1],
+                prompt_embeds=prompt_embeds,
+                pooled_prompt_embeds=pooled_prompt_embeds,
+                width=width,
+                height=height,
                 guidance_scale=guidance_scale,
                 num_inference_steps=num_inference_steps,
-                generator=generator,
+                generator=self._make_generators(seed, num_images),
                 **kwargs
             )
             
-            return result.images[0]
+            return result.images
             
         except Exception as e:
             logger.error(f"Image editing failed: {str(e)}")
             raise GenerationError(f"Editing failed: {str(e)}")
     
+    @torch.inference_mode()
     def generate_variations(
         self,
         image: Image.Image,
-        prompt: str,
+        prompt: Union[str, List[str]],
         num_images: int = 1,
         guidance_scale: float = 2.5,
         num_inference_steps: int = 28,
@@ -184,44 +344,42 @@ class FluxModelManager:
         seed: Optional[int] = None,
         **kwargs
     ) -> List[Image.Image]:
-        """生成图片变体"""
+        """生成图片变体
+        
+        prompt 为字符串时生成 num_images 个同提示词的变体；为列表时每个提示词生成一个变体。
+        所有变体在一次管道调用中批量生成。
+        """
         self._ensure_model_loaded()
         
         try:
-            # 确保图片为RGB格式
+            # 确保图片为RGB格式（以PIL传入，管道按目标分辨率做Lanczos缩放）
             if image.mode != 'RGB':
                 image = image.convert('RGB')
+            width, height = image.size
             
-            images = []
-            
-            for i in range(num_images):
-                # 为每张图片设置不同的种子
-                current_seed = seed + i if seed is not None else None
-                generator = None
-                if current_seed is not None:
-                    # 确保种子值在有效范围内 (0 到 2^32-1)
-                    safe_seed = abs(current_seed) % (2**32)
-                    generator = torch.Generator(device=self._pipeline.device)
-                    generator.manual_seed(safe_seed)
-                
-                # 构建变体提示词
-                variation_prompt = f"Based on this image, {prompt}. Keep the main subject but add variations."
-                
-                # 生成变体 - 移除不支持的strength参数
-                result = self._pipeline(
-                    image=image,
-                    prompt=variation_prompt,
-                    width=image.size[0],
-                    height=image.size[1],
-                    guidance_scale=guidance_scale,
-                    num_inference_steps=num_inference_steps,
-                    generator=generator,
-                    **kwargs
-                )
-                
-                images.append(result.images[0])
+            prompts = [prompt] * num_images if isinstance(prompt, str) else list(prompt)
+            
+            # 构建变体提示词
+            variation_prompts = [
+                f"Based on this image, {p}. Keep the main subject but add variations."
+                for p in prompts
+            ]
+            
+            # 生成变体 - 移除不支持的strength参数
+            prompt_embeds, pooled_prompt_embeds = self._prompt_embeds(variation_prompts)
+            result = self._pipeline(
+                image=image,
+                prompt_embeds=prompt_embeds,
+                pooled_prompt_embeds=pooled_prompt_embeds,
+                width=width,
+                height=height,
+                guidance_scale=guidance_scale,
+                num_inference_steps=num_inference_steps,
+                generator=self._make_generators(seed, len(variation_prompts)),
+                **kwargs
+            )
             
-            return images
+            return result.images
             
         except Exception as e:
             logger.error(f"Variation generation failed: {str(e)}")
@@ -1,9 +1,10 @@
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, PrivateAttr, model_validator, validator
 from typing import Optional, List, Literal, Union
 from enum import Enum
-import base64
+import binascii
 import io
 from PIL import Image
+from app.core.config import settings
 
 
 class ResponseFormat(str, Enum):
@@ -12,6 +13,13 @@ class ResponseFormat(str, Enum):
     B64_JSON = "b64_json"
 
 
+class OutputFormat(str, Enum):
+    """输出图片编码格式枚举"""
+    PNG = "png"
+    JPEG = "jpeg"
+    WEBP = "webp"
+
+
 class ImageSize(str, Enum):
     """图片尺寸枚举"""
     SIZE_256 = "256x256"
@@ -21,12 +29,65 @@ class ImageSize(str, Enum):
     SIZE_1024_1792 = "1024x1792"
 
 
+# base64长度估算解码大小时的余量（填充字符、换行符）
+BASE64_SIZE_SLACK = 1.02
+
+
+def _has_image_signature(data: bytes) -> bool:
+    """通过文件头魔数判断是否为支持的图片格式（PNG/JPEG/WEBP）"""
+    return (
+        data.startswith(b"\x89PNG\r\n\x1a\n")
+        or data.startswith(b"\xff\xd8\xff")
+        or (data[:4] == b"RIFF" and data[8:12] == b"WEBP")
+    )
+
+
+class ImageInputMixin(BaseModel):
+    """包含base64输入图片（image字段）的请求
+    
+    校验时解码一次base64并缓存原始字节，服务层通过 image_bytes 复用，不再重复解码。
+    """
+    _image_bytes: Optional[bytes] = PrivateAttr(default=None)
+    
+    @model_validator(mode='after')
+    def validate_image(self):
+        """验证base64图片格式"""
+        # 移除可能的data URL前缀
+        if self.image.startswith('data:image'):
+            self.image = self.image.partition(',')[2]
+        
+        # 根据base64长度估算解码后大小，超限的请求在解析阶段直接拒绝，不分配解码缓冲区
+        estimated_size = (len(self.image) * 3) >> 2
+        if estimated_size > settings.max_file_size * BASE64_SIZE_SLACK:
+            raise ValueError(f"Image size exceeds maximum {settings.max_file_size} bytes")
+        
+        try:
+            # 解码base64
+            image_data = binascii.a2b_base64(self.image)
+            
+            # 只检查文件头魔数并解析图片头（Image.open不解码像素），像素解码推迟到服务层且只做一次
+            if not _has_image_signature(image_data):
+                raise ValueError("Unsupported image signature")
+            Image.open(io.BytesIO(image_data))
+        except Exception:
+            raise ValueError("Invalid base64 image format")
+        
+        self._image_bytes = image_data
+        return self
+    
+    @property
+    def image_bytes(self) -> bytes:
+        """解码后的输入图片字节"""
+        return self._image_bytes
+
+
 class BaseImageRequest(BaseModel):
     """基础图片请求模型"""
     prompt: str = Field(..., description="生成或编辑的提示词", min_length=1, max_length=4000)
     n: int = Field(1, description="生成图片数量", ge=1, le=10)
     size: Optional[str] = Field("1024x1024", description="图片尺寸")
     response_format: ResponseFormat = Field(ResponseFormat.URL, description="响应格式")
+    output_format: OutputFormat = Field(OutputFormat.PNG, description="输出图片编码格式（png无损，jpeg/webp体积更小、编码更快）")
     user: Optional[str] = Field(None, description="用户标识")
 
 
@@ -37,39 +98,21 @@ class ImageGenerationRequest(BaseImageRequest):
     seed: Optional[int] = Field(None, description="随机种子")
 
 
-class ImageEditRequest(BaseImageRequest):
+class ImageEditRequest(BaseImageRequest, ImageInputMixin):
     """图片编辑请求模型"""
     image: str = Field(..., description="base64编码的输入图片")
     guidance_scale: float = Field(2.5, description="引导强度", ge=1.0, le=10.0)
     num_inference_steps: int = Field(28, description="推理步数", ge=1, le=50)
     seed: Optional[int] = Field(None, description="随机种子")
-    
-    @validator('image')
-    def validate_image(cls, v):
-        """验证base64图片格式"""
-        try:
-            # 移除可能的data URL前缀
-            if v.startswith('data:image'):
-                v = v.split(',')[1]
-            
-            # 解码base64
-            image_data = base64.b64decode(v)
-            
-            # 验证是否为有效图片
-            image = Image.open(io.BytesIO(image_data))
-            image.verify()
-            
-            return v
-        except Exception:
-            raise ValueError("Invalid base64 image format")
 
 
-class ImageVariationRequest(BaseModel):
+class ImageVariationRequest(ImageInputMixin):
     """图片变体生成请求模型"""
     image: str = Field(..., description="base64编码的参考图片")
     prompts: List[str] = Field(..., description="提示词列表，每个提示词对应一个变体图片", min_items=1, max_items=10)
     size: Optional[str] = Field("1024x1024", description="图片尺寸")
     response_format: ResponseFormat = Field(ResponseFormat.URL, description="响应格式")
+    output_format: OutputFormat = Field(OutputFormat.PNG, description="输出图片编码格式（png无损，jpeg/webp体积更小、编码更快）")
     user: Optional[str] = Field(None, description="用户标识")
     guidance_scale: float = Field(2.5, description="引导强度", ge=1.0, le=10.0)
     num_inference_steps: int = Field(28, description="推理步数", ge=1, le=50)
@@ -86,21 +129,6 @@ class ImageVariationRequest(BaseModel):
                 raise ValueError("Each prompt must be less than 4000 characters")
         return v
     
-    @validator('image')
-    def validate_image(cls, v):
-        """验证base64图片格式"""
-        try:
-            if v.startswith('data:image'):
-                v = v.split(',')[1]
-            
-            image_data = base64.b64decode(v)
-            image = Image.open(io.BytesIO(image_data))
-            image.verify()
-            
-            return v
-        except Exception:
-            raise ValueError("Invalid base64 image format")
-    
     @property
     def n(self) -> int:
         """返回图片生成数量，等于提示词数量"""
@@ -10,22 +10,23 @@ from app.models.schemas import (
     ImageGenerationRequest,
     ImageEditRequest,
     ImageVariationRequest,
+    ImageResponse,
     ResponseFormat
 )
 from app.utils.image_utils import (
-    decode_base64_image,
+    load_image_bytes,
     parse_image_size,
-    validate_image_size,
     resize_image
 )
 from app.utils.response_utils import (
-    create_image_response,
+    create_image_response_async,
+    encode_executor,
     validate_generation_params,
     log_request_info,
     create_success_log,
     calculate_processing_time
 )
-from app.core.exceptions import GenerationError, ImageProcessingError
+from app.core.exceptions import APIException, GenerationError, ImageProcessingError
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -35,19 +36,22 @@ class ImageService:
     """图片生成服务类"""
     
     def __init__(self):
-        self.executor = ThreadPoolExecutor(max_workers=2)  # 限制并发数
+        # GPU推理串行执行：单卡上多线程并发会争用CUDA上下文和缓存分配器，且批量推理已经能充分利用GPU
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu-worker")
+        # 图片解码/编码/写盘等CPU和IO任务复用响应编码线程池（PIL编码时释放GIL，可多核并行），不占用GPU线程
+        self.io_executor = encode_executor
     
     async def generate_images(
         self,
         request: ImageGenerationRequest,
         base_url: str = ""
-    ) -> dict:
+    ) -> ImageResponse:
         """生成图片"""
-        start_time = time.time()
+        start_time = time.monotonic()
         
         try:
             # 记录请求信息
-            log_request_info("generate_images", request.dict(), request.user)
+            log_request_info("generate_images", request, request.user)
             
             # 验证参数
             validate_generation_params(
@@ -70,18 +74,20 @@ class ImageService:
                 seed=request.seed
             )
             
-            # 创建响应
-            response = create_image_response(
+            # 创建响应（在IO线程池中并行编码各张图片）
+            response = await create_image_response_async(
                 images=images,
                 response_format=request.response_format,
-                base_url=base_url
+                base_url=base_url,
+                executor=self.io_executor,
+                output_format=request.output_format
             )
             
             # 记录成功日志
             processing_time = calculate_processing_time(start_time)
             create_success_log("generate_images", processing_time, len(images), request.user)
             
-            return response.dict()
+            return response
             
         except Exception as e:
             logger.error(f"Image generation failed: {str(e)}")
@@ -91,13 +97,13 @@ class ImageService:
         self,
         request: ImageEditRequest,
         base_url: str = ""
-    ) -> dict:
+    ) -> ImageResponse:
         """编辑图片"""
-        start_time = time.time()
+        start_time = time.monotonic()
         
         try:
             # 记录请求信息
-            log_request_info("edit_image", {k: v for k, v in request.dict().items() if k != 'image'}, request.user)
+            log_request_info("edit_image", request, request.user)
             
             # 验证参数
             validate_generation_params(
@@ -106,15 +112,17 @@ class ImageService:
                 request.n
             )
             
-            # 解码输入图片
-            input_image = decode_base64_image(request.image)
-            validate_image_size(input_image)
+            target_size = parse_image_size(request.size) if request.size else None
+            
+            # 解码输入图片（base64已在请求校验时解码，这里只在线程池中做像素解码）
+            loop = asyncio.get_event_loop()
+            input_image = await loop.run_in_executor(
+                self.io_executor, load_image_bytes, request.image_bytes, target_size
+            )
             
             # 调整图片尺寸（如果指定了size）
-            if request.size:
-                target_width, target_height = parse_image_size(request.size)
-                if input_image.size != (target_width, target_height):
-                    input_image = resize_image(input_image, (target_width, target_height))
+            if target_size is not None and input_image.size != target_size:
+                input_image = resize_image(input_image, target_size)
             
             # 编辑图片
             images = await self._edit_multiple_images(
@@ -126,19 +134,24 @@ class ImageService:
                 seed=request.seed
             )
             
-            # 创建响应
-            response = create_image_response(
+            # 创建响应（在IO线程池中并行编码各张图片）
+            response = await create_image_response_async(
                 images=images,
                 response_format=request.response_format,
-                base_url=base_url
+                base_url=base_url,
+                executor=self.io_executor,
+                output_format=request.output_format
             )
             
             # 记录成功日志
             processing_time = calculate_processing_time(start_time)
             create_success_log("edit_image", processing_time, len(images), request.user)
             
-            return response.dict()
+            return response
             
+        except APIException:
+            # 输入校验错误（如图片损坏、尺寸超限）保持原有状态码
+            raise
         except Exception as e:
             logger.error(f"Image editing failed: {str(e)}")
             raise GenerationError(f"Failed to edit image: {str(e)}")
@@ -147,13 +160,13 @@ class ImageService:
         self,
         request: ImageVariationRequest,
         base_url: str = ""
-    ) -> dict:
+    ) -> ImageResponse:
         """生成图片变体"""
-        start_time = time.time()
+        start_time = time.monotonic()
         
         try:
             # 记录请求信息
-            log_request_info("generate_variations", {k: v for k, v in request.dict().items() if k != 'image'}, request.user)
+            log_request_info("generate_variations", request, request.user)
             
             # 验证参数
             validate_generation_params(
@@ -162,15 +175,17 @@ class ImageService:
                 request.n
             )
             
-            # 解码输入图片
-            input_image = decode_base64_image(request.image)
-            validate_image_size(input_image)
+            target_size = parse_image_size(request.size) if request.size else None
+            
+            # 解码输入图片（base64已在请求校验时解码，这里只在线程池中做像素解码）
+            loop = asyncio.get_event_loop()
+            input_image = await loop.run_in_executor(
+                self.io_executor, load_image_bytes, request.image_bytes, target_size
+            )
             
             # 调整图片尺寸（如果指定了size）
-            if request.size:
-                target_width, target_height = parse_image_size(request.size)
-                if input_image.size != (target_width, target_height):
-                    input_image = resize_image(input_image, (target_width, target_height))
+            if target_size is not None and input_image.size != target_size:
+                input_image = resize_image(input_image, target_size)
             
             # 生成变体 - 支持多个提示词
             images = await self._generate_image_variations(
@@ -182,19 +197,24 @@ class ImageService:
                 seed=request.seed
             )
             
-            # 创建响应
-            response = create_image_response(
+            # 创建响应（在IO线程池中并行编码各张图片）
+            response = await create_image_response_async(
                 images=images,
                 response_format=request.response_format,
-                base_url=base_url
+                base_url=base_url,
+                executor=self.io_executor,
+                output_format=request.output_format
             )
             
             # 记录成功日志
             processing_time = calculate_processing_time(start_time)
             create_success_log("generate_variations", processing_time, len(images), request.user)
             
-            return response.dict()
+            return response
             
+        except APIException:
+            # 输入校验错误（如图片损坏、尺寸超限）保持原有状态码
+            raise
         except Exception as e:
             logger.error(f"Variation generation failed: {str(e)}")
             raise GenerationError(f"Failed to generate variations: {str(e)}")
@@ -209,32 +229,20 @@ class ImageService:
         num_inference_steps: int,
         seed: Optional[int] = None
     ) -> List[Image.Image]:
-        """生成多张图片"""
-        images = []
-        
-        for i in range(num_images):
-            # 为每张图片设置不同的种子
-            current_seed = (seed + i) if seed is not None else None
-            if current_seed is not None:
-                # 确保种子值在有效范围内
-                current_seed = abs(current_seed) % (2**32)
-            
-            # 在线程池中执行生成任务
-            loop = asyncio.get_event_loop()
-            image = await loop.run_in_executor(
-                self.executor,
-                model_manager.generate_image,
-                prompt,
-                width,
-                height,
-                guidance_scale,
-                num_inference_steps,
-                current_seed
-            )
-            
-            images.append(image)
-        
-        return images
+        """生成多张图片（一次批量推理）"""
+        # 在线程池中执行生成任务
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            model_manager.generate_image_batch,
+            prompt,
+            width,
+            height,
+            num_images,
+            guidance_scale,
+            num_inference_steps,
+            seed
+        )
     
     async def _edit_multiple_images(
         self,
@@ -245,31 +253,19 @@ class ImageService:
         num_inference_steps: int,
         seed: Optional[int] = None
     ) -> List[Image.Image]:
-        """编辑多张图片"""
-        images = []
-        
-        for i in range(num_images):
-            # 为每张图片设置不同的种子
-            current_seed = (seed + i) if seed is not None else None
-            if current_seed is not None:
-                # 确保种子值在有效范围内
-                current_seed = abs(current_seed) % (2**32)
-            
-            # 在线程池中执行编辑任务
-            loop = asyncio.get_event_loop()
-            edited_image = await loop.run_in_executor(
-                self.executor,
-                model_manager.edit_image,
-                image,
-                prompt,
-                guidance_scale,
-                num_inference_steps,
-                current_seed
-            )
-            
-            images.append(edited_image)
-        
-        return images
+        """编辑多张图片（一次批量推理）"""
+        # 在线程池中执行编辑任务
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            model_manager.edit_image_batch,
+            image,
+            prompt,
+            num_images,
+            guidance_scale,
+            num_inference_steps,
+            seed
+        )
     
     async def _generate_image_variations(
         self,
@@ -280,37 +276,20 @@ class ImageService:
         variation_strength: float,
         seed: Optional[int] = None
     ) -> List[Image.Image]:
-        """生成图片变体（多个提示词，每个提示词对应一个变体）"""
-        images = []
-        
-        for i, prompt in enumerate(prompts):
-            # 为每个提示词设置不同的种子
-            current_seed = (seed + i) if seed is not None else None
-            if current_seed is not None:
-                # 确保种子值在有效范围内
-                current_seed = abs(current_seed) % (2**32)
-            
-            # 在线程池中执行变体生成任务
-            loop = asyncio.get_event_loop()
-            variation_image = await loop.run_in_executor(
-                self.executor,
-                model_manager.generate_variations,
-                image,
-                prompt,
-                1,  # 每个提示词生成一张图片
-                guidance_scale,
-                num_inference_steps,
-                variation_strength,
-                current_seed
-            )
-            
-            # generate_variations返回的是列表，取第一个元素
-            if isinstance(variation_image, list):
-                images.append(variation_image[0])
-            else:
-                images.append(variation_image)
-        
-        return images
+        """生成图片变体（多个提示词，每个提示词对应一个变体，一次批量推理）"""
+        # 在线程池中执行变体生成任务
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            model_manager.generate_variations,
+            image,
+            prompts,
+            len(prompts),
+            guidance_scale,
+            num_inference_steps,
+            variation_strength,
+            seed
+        )
 
 
 # 全局图片服务实例
@@ -1,12 +1,36 @@
 import base64
+import binascii
 import io
+import logging
 import os
+import re
 import uuid
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
 from PIL import Image
 import numpy as np
 from app.core.config import settings
 from app.core.exceptions import InvalidImageFormat, ImageTooLarge, ImageProcessingError
+from app.models.schemas import BASE64_SIZE_SLACK, ImageSize
+
+# 可选依赖：pybase64使用SIMD实现，比标准库base64快一个数量级；未安装时回退到标准库
+try:
+    from pybase64 import b64encode_as_string as _b64encode_as_string
+except ImportError:
+    def _b64encode_as_string(data) -> str:
+        return base64.b64encode(data).decode('ascii')
+
+# 允许的输入图片格式
+_SUPPORTED_FORMATS = ("JPEG", "PNG", "WEBP")
+
+# 各输出格式的编码参数：生成结果熵高，PNG高压缩级别几乎不减小体积却显著增加编码耗时
+_ENCODE_OPTIONS = {
+    "PNG": {"compress_level": 1},
+    "JPEG": {"quality": 90, "optimize": False},
+    "WEBP": {"quality": 90, "method": 0},
+}
+
+# 自定义尺寸字符串格式，例如 "1024x768"
+_SIZE_PATTERN = re.compile(r'^\s*(\d+)\s*x\s*(\d+)\s*$')
 
 
 def decode_base64_image(base64_string: str) -> Image.Image:
@@ -16,19 +40,44 @@ def decode_base64_image(base64_string: str) -> Image.Image:
         if base64_string.startswith('data:image'):
             base64_string = base64_string.split(',')[1]
         
-        # 解码base64
-        image_data = base64.b64decode(base64_string)
+        # 根据base64长度估算解码后大小，超限时无需分配解码缓冲区
+        # （留2%余量容纳填充和换行符，精确检查在解码后进行）
+        estimated_size = (len(base64_string) * 3) >> 2
+        if estimated_size > settings.max_file_size * BASE64_SIZE_SLACK:
+            raise ImageTooLarge(f"Image size {estimated_size} exceeds maximum {settings.max_file_size} bytes")
         
+        # 解码base64（binascii为C实现，省去base64模块的额外包装）
+        image_data = binascii.a2b_base64(base64_string)
+    except ImageTooLarge:
+        raise
+    except Exception as e:
+        raise InvalidImageFormat(f"Failed to decode base64 image: {str(e)}")
+    
+    return load_image_bytes(image_data)
+
+
+def load_image_bytes(image_data: bytes, target_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """从原始字节加载图片（完成像素解码，适合在线程池中执行）
+    
+    尺寸按文件头中的原始尺寸校验；指定target_size时，JPEG在解码阶段缩小到不低于该尺寸。
+    """
+    try:
         # 检查文件大小
         if len(image_data) > settings.max_file_size:
             raise ImageTooLarge(f"Image size {len(image_data)} exceeds maximum {settings.max_file_size} bytes")
         
-        # 创建PIL图片对象
-        image = Image.open(io.BytesIO(image_data))
+        # 创建PIL图片对象（只尝试支持的格式，跳过PIL逐个插件探测）
+        image = Image.open(io.BytesIO(image_data), formats=_SUPPORTED_FORMATS)
         
-        # 验证图片格式
-        if image.format.lower() not in ['jpeg', 'jpg', 'png', 'webp']:
-            raise InvalidImageFormat(f"Unsupported image format: {image.format}")
+        # 文件头已给出原始尺寸，在draft缩小之前校验，各格式的限制保持一致
+        validate_image_size(image)
+        
+        # JPEG可在解码时按2的幂次缩小（libjpeg跳过部分IDCT），结果仍不小于目标输出尺寸
+        if target_size is not None and image.format == "JPEG":
+            image.draft("RGB", target_size)
+        
+        # 立即解码像素数据，避免之后在事件循环线程中触发惰性加载
+        image.load()
         
         return image
         
@@ -38,23 +87,29 @@ def decode_base64_image(base64_string: str) -> Image.Image:
         raise InvalidImageFormat(f"Failed to decode base64 image: {str(e)}")
 
 
+def encode_image(image: Image.Image, format: str = "PNG") -> io.BytesIO:
+    """将PIL图片编码到内存缓冲区（调用方可用getbuffer()无拷贝地读取编码结果）"""
+    buffer = io.BytesIO()
+    
+    # 确保图片为RGB模式（PNG需要）
+    if format.upper() == "PNG" and image.mode in ("RGBA", "LA"):
+        # 保持透明度
+        pass
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    # 保存到缓冲区
+    image.save(buffer, format=format, **_ENCODE_OPTIONS.get(format.upper(), {}))
+    return buffer
+
+
 def encode_image_to_base64(image: Image.Image, format: str = "PNG") -> str:
     """将PIL图片编码为base64字符串"""
     try:
-        buffer = io.BytesIO()
-        
-        # 确保图片为RGB模式（PNG需要）
-        if format.upper() == "PNG" and image.mode in ("RGBA", "LA"):
-            # 保持透明度
-            pass
-        elif image.mode != "RGB":
-            image = image.convert("RGB")
-        
-        # 保存到缓冲区
-        image.save(buffer, format=format, quality=95 if format.upper() == "JPEG" else None)
+        buffer = encode_image(image, format)
         
-        # 编码为base64
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        # 编码为base64（getbuffer直接引用缓冲区内容，省去getvalue的一次拷贝）
+        image_base64 = _b64encode_as_string(buffer.getbuffer())
         
         return image_base64
         
@@ -62,7 +117,12 @@ def encode_image_to_base64(image: Image.Image, format: str = "PNG") -> str:
         raise ImageProcessingError(f"Failed to encode image to base64: {str(e)}")
 
 
-def save_image(image: Image.Image, filename: Optional[str] = None, directory: str = None) -> str:
+def save_image(
+    image: Image.Image,
+    filename: Optional[str] = None,
+    directory: str = None,
+    format: str = "PNG"
+) -> str:
     """保存图片到文件系统并返回文件路径"""
     try:
         if directory is None:
@@ -73,7 +133,7 @@ def save_image(image: Image.Image, filename: Optional[str] = None, directory: st
         
         # 生成文件名
         if filename is None:
-            filename = f"{uuid.uuid4().hex}.png"
+            filename = f"{uuid.uuid4().hex}.{format.lower()}"
         
         # 完整文件路径
         file_path = os.path.join(directory, filename)
@@ -83,7 +143,7 @@ def save_image(image: Image.Image, filename: Optional[str] = None, directory: st
             image = image.convert("RGB")
         
         # 保存图片
-        image.save(file_path, "PNG", quality=95)
+        image.save(file_path, format, **_ENCODE_OPTIONS.get(format.upper(), {}))
         
         return file_path
         
@@ -95,21 +155,25 @@ def resize_image(image: Image.Image, target_size: Tuple[int, int], maintain_aspe
     """调整图片尺寸"""
     try:
         if maintain_aspect_ratio:
-            # 保持宽高比
-            image.thumbnail(target_size, Image.Resampling.LANCZOS)
+            # 保持宽高比：一次性计算适配尺寸，只做一次重采样（与thumbnail一致，不放大）
+            width, height = image.size
+            scale = min(target_size[0] / width, target_size[1] / height, 1.0)
+            fit_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            if fit_size != image.size:
+                image = image.resize(fit_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
             
             # 如果需要精确尺寸，创建新图片并居中粘贴
-            if image.size != target_size:
+            if fit_size != target_size:
                 new_image = Image.new("RGB", target_size, (255, 255, 255))
-                paste_x = (target_size[0] - image.size[0]) // 2
-                paste_y = (target_size[1] - image.size[1]) // 2
+                paste_x = (target_size[0] - fit_size[0]) // 2
+                paste_y = (target_size[1] - fit_size[1]) // 2
                 new_image.paste(image, (paste_x, paste_y))
                 return new_image
             
             return image
         else:
             # 直接调整到目标尺寸
-            return image.resize(target_size, Image.Resampling.LANCZOS)
+            return image.resize(target_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
             
     except Exception as e:
         raise ImageProcessingError(f"Failed to resize image: {str(e)}")
@@ -130,25 +194,49 @@ def validate_image_size(image: Image.Image) -> bool:
     return True
 
 
+def _check_size_range(width: int, height: int):
+    """检查尺寸是否在允许范围内"""
+    if width < settings.min_image_size or height < settings.min_image_size:
+        raise ValueError(f"Size too small. Minimum: {settings.min_image_size}x{settings.min_image_size}")
+    
+    if width > settings.max_image_size or height > settings.max_image_size:
+        raise ValueError(f"Size too large. Maximum: {settings.max_image_size}x{settings.max_image_size}")
+
+
+def _parse_size(size_string: str) -> Tuple[int, int]:
+    """解析并校验尺寸字符串"""
+    match = _SIZE_PATTERN.match(size_string)
+    if match is None:
+        raise ValueError("Invalid size format")
+    
+    width, height = int(match.group(1)), int(match.group(2))
+    _check_size_range(width, height)
+    return (width, height)
+
+
+def _build_size_cache() -> Dict[str, Tuple[int, int]]:
+    """预先解析ImageSize枚举中在允许范围内的尺寸"""
+    cache = {}
+    for size in ImageSize:
+        try:
+            cache[size.value] = _parse_size(size.value)
+        except ValueError:
+            pass
+    return cache
+
+
+# 标准尺寸直接查表，自定义尺寸才走正则解析
+_SIZE_CACHE = _build_size_cache()
+
+
 def parse_image_size(size_string: str) -> Tuple[int, int]:
     """解析图片尺寸字符串 (例如: "1024x1024")"""
+    size = _SIZE_CACHE.get(size_string)
+    if size is not None:
+        return size
+    
     try:
-        if 'x' not in size_string:
-            raise ValueError("Invalid size format")
-        
-        width_str, height_str = size_string.split('x')
-        width = int(width_str)
-        height = int(height_str)
-        
-        # 验证尺寸范围
-        if width < settings.min_image_size or height < settings.min_image_size:
-            raise ValueError(f"Size too small. Minimum: {settings.min_image_size}x{settings.min_image_size}")
-        
-        if width > settings.max_image_size or height > settings.max_image_size:
-            raise ValueError(f"Size too large. Maximum: {settings.max_image_size}x{settings.max_image_size}")
-        
-        return (width, height)
-        
+        return _parse_size(size_string)
     except Exception as e:
         raise InvalidImageFormat(f"Invalid image size format '{size_string}': {str(e)}")
 
@@ -172,7 +260,6 @@ def cleanup_temp_files(file_paths: list):
                 os.remove(file_path)
         except Exception as e:
             # 记录错误但不抛出异常
-            import logging
             logging.warning(f"Failed to cleanup temp file {file_path}: {str(e)}")
 
 
@@ -183,5 +270,6 @@ def get_image_info(image: Image.Image) -> dict:
         "height": image.size[1],
         "mode": image.mode,
         "format": image.format,
-        "size_bytes": len(image.tobytes()) if hasattr(image, 'tobytes') else None
+        # 按尺寸和通道数计算未压缩像素大小，无需通过tobytes()拷贝整个像素缓冲区
+        "size_bytes": image.size[0] * image.size[1] * len(image.getbands())
     }
\ No newline at end of file
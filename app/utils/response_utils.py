@@ -1,44 +1,126 @@
+import asyncio
+import os
+import sys
 import time
-from typing import List, Optional
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 from PIL import Image
-from app.models.schemas import ImageResponse, ImageData, ResponseFormat
-from app.utils.image_utils import encode_image_to_base64, save_image, create_image_url
+from pydantic import BaseModel
+from app.models.schemas import ImageResponse, ImageData, ResponseFormat, OutputFormat
+from app.utils.image_utils import encode_image_to_base64
+from app.utils.storage import storage
 from app.core.config import settings
+from app.core.exceptions import InvalidParameters
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 文件名中的不安全字符统一替换为下划线
+_UNSAFE_CHARS = '<>:"/\\|?*'
+_UNSAFE_FILENAME_CHARS = str.maketrans({c: '_' for c in _UNSAFE_CHARS})
+
+# (scheme, host) -> 基础URL；host来自请求头，设置上限防止被伪造的Host头撑大
+_BASE_URL_CACHE: Dict[Tuple[str, str], str] = {}
+_BASE_URL_CACHE_MAX_SIZE = 1024
+
+# 图片编码/保存共用的线程池
+encode_executor = ThreadPoolExecutor(
+    max_workers=min(8, os.cpu_count() or 1),
+    thread_name_prefix="encode-worker"
+)
+
+
+def _unix_timestamp() -> int:
+    """当前Unix时间戳（秒），time_ns避免浮点转换"""
+    return time.time_ns() // 1_000_000_000
+
+
+def create_image_data(
+    image: Image.Image,
+    response_format: ResponseFormat,
+    base_url: str = "",
+    revised_prompt: Optional[str] = None,
+    output_format: OutputFormat = OutputFormat.PNG
+) -> ImageData:
+    """创建单张图片的响应数据（包含图片编码/写盘，属于CPU和IO密集操作）"""
+    url = None
+    b64_json = None
+    image_format = output_format.value.upper()
+    
+    if response_format == ResponseFormat.URL:
+        # 保存图片并返回URL（本地文件或对象存储的预签名URL）
+        url = storage.store(image, image_format, base_url)
+    
+    elif response_format == ResponseFormat.B64_JSON:
+        # 返回base64编码
+        b64_json = encode_image_to_base64(image, image_format)
+    
+    # 字段值均由服务端生成，一次性构造并跳过校验
+    return ImageData.model_construct(url=url, b64_json=b64_json, revised_prompt=revised_prompt)
+
+
+def _revised_prompt_at(revised_prompts: Optional[List[str]], index: int) -> Optional[str]:
+    """取第index张图片对应的修订提示词"""
+    if revised_prompts and index < len(revised_prompts):
+        return revised_prompts[index]
+    return None
+
 
 def create_image_response(
     images: List[Image.Image],
     response_format: ResponseFormat,
     base_url: str = "",
-    revised_prompts: Optional[List[str]] = None
+    revised_prompts: Optional[List[str]] = None,
+    output_format: OutputFormat = OutputFormat.PNG,
+    created_ts: Optional[int] = None
 ) -> ImageResponse:
-    """创建图片响应对象"""
+    """创建图片响应对象（created_ts 为空时取当前时间）"""
     try:
-        image_data_list = []
+        # PIL编码器和base64编码都会释放GIL，多张图片在线程池中并行编码（map保持原有顺序）
+        image_data_list = list(encode_executor.map(
+            lambda i: create_image_data(
+                images[i], response_format, base_url, _revised_prompt_at(revised_prompts, i), output_format
+            ),
+            range(len(images))
+        ))
         
-        for i, image in enumerate(images):
-            image_data = ImageData()
-            
-            if response_format == ResponseFormat.URL:
-                # 保存图片并返回URL
-                file_path = save_image(image)
-                image_data.url = create_image_url(file_path, base_url)
-            
-            elif response_format == ResponseFormat.B64_JSON:
-                # 返回base64编码
-                image_data.b64_json = encode_image_to_base64(image, "PNG")
-            
-            # 添加修订后的提示词（如果有）
-            if revised_prompts and i < len(revised_prompts):
-                image_data.revised_prompt = revised_prompts[i]
-            
-            image_data_list.append(image_data)
+        return ImageResponse.model_construct(
+            created=_unix_timestamp() if created_ts is None else created_ts,
+            data=image_data_list
+        )
         
-        return ImageResponse(
-            created=int(time.time()),
+    except Exception as e:
+        logger.error(f"Failed to create image response: {str(e)}")
+        raise
+
+
+async def create_image_response_async(
+    images: List[Image.Image],
+    response_format: ResponseFormat,
+    base_url: str = "",
+    revised_prompts: Optional[List[str]] = None,
+    executor: Optional[Executor] = None,
+    output_format: OutputFormat = OutputFormat.PNG,
+    created_ts: Optional[int] = None
+) -> ImageResponse:
+    """在线程池中并行编码/保存各张图片后创建响应对象，不阻塞事件循环"""
+    try:
+        loop = asyncio.get_running_loop()
+        image_data_list = await asyncio.gather(*[
+            loop.run_in_executor(
+                executor or encode_executor,
+                create_image_data,
+                image,
+                response_format,
+                base_url,
+                _revised_prompt_at(revised_prompts, i),
+                output_format
+            )
+            for i, image in enumerate(images)
+        ])
+        
+        return ImageResponse.model_construct(
+            created=_unix_timestamp() if created_ts is None else created_ts,
             data=image_data_list
         )
         
@@ -51,11 +133,17 @@ def create_single_image_response(
     image: Image.Image,
     response_format: ResponseFormat,
     base_url: str = "",
-    revised_prompt: Optional[str] = None
+    revised_prompt: Optional[str] = None,
+    output_format: OutputFormat = OutputFormat.PNG
 ) -> ImageResponse:
-    """创建单张图片响应对象"""
-    revised_prompts = [revised_prompt] if revised_prompt else None
-    return create_image_response([image], response_format, base_url, revised_prompts)
+    """创建单张图片响应对象（最常见的n=1情况，直接在当前线程编码，不经过列表和线程池）"""
+    try:
+        image_data = create_image_data(image, response_format, base_url, revised_prompt or None, output_format)
+        return ImageResponse.model_construct(created=_unix_timestamp(), data=[image_data])
+    
+    except Exception as e:
+        logger.error(f"Failed to create image response: {str(e)}")
+        raise
 
 
 def format_error_response(message: str, error_type: str = "api_error", code: int = 400) -> dict:
@@ -74,58 +162,70 @@ def validate_generation_params(
     num_inference_steps: int,
     n: int
 ) -> None:
-    """验证生成参数"""
-    from app.core.exceptions import InvalidParameters
-    
-    if not (1.0 <= guidance_scale <= 10.0):
-        raise InvalidParameters(f"guidance_scale must be between 1.0 and 10.0, got {guidance_scale}")
-    
-    if not (1 <= num_inference_steps <= settings.max_num_inference_steps):
-        raise InvalidParameters(f"num_inference_steps must be between 1 and {settings.max_num_inference_steps}, got {num_inference_steps}")
-    
-    if not (1 <= n <= settings.max_batch_size):
-        raise InvalidParameters(f"n must be between 1 and {settings.max_batch_size}, got {n}")
+    """验证生成参数（错误信息只在校验失败时才格式化）"""
+    checks = (
+        ("guidance_scale", guidance_scale, 1.0, 10.0),
+        ("num_inference_steps", num_inference_steps, 1, settings.max_num_inference_steps),
+        ("n", n, 1, settings.max_batch_size),
+    )
+    for name, value, low, high in checks:
+        if not (low <= value <= high):
+            raise InvalidParameters(f"{name} must be between {low} and {high}, got {value}")
 
 
-def log_request_info(endpoint: str, params: dict, user_id: Optional[str] = None):
-    """记录请求信息"""
+def log_request_info(endpoint: str, params: Union[dict, BaseModel], user_id: Optional[str] = None):
+    """记录请求信息（params可直接传请求模型，INFO未启用时不做任何转换）"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
+    # 不记录图片数据
+    if isinstance(params, BaseModel):
+        params = params.model_dump(exclude={'image'})
+    else:
+        params = {k: v for k, v in params.items() if k != 'image'}
     log_data = {
         "endpoint": endpoint,
         "user_id": user_id,
-        "params": {
-            k: v for k, v in params.items() 
-            if k not in ['image']  # 不记录图片数据
-        }
+        "params": params
     }
-    logger.info(f"API Request: {log_data}")
+    logger.info("API Request: %s", log_data)
 
 
 def calculate_processing_time(start_time: float) -> float:
-    """计算处理时间"""
-    return round(time.time() - start_time, 2)
+    """计算处理时间（秒），start_time 需来自 time.monotonic()"""
+    return time.monotonic() - start_time
 
 
 def create_success_log(endpoint: str, processing_time: float, num_images: int, user_id: Optional[str] = None):
     """创建成功日志"""
-    logger.info(f"API Success: {endpoint} - {num_images} images generated in {processing_time}s (user: {user_id})")
+    logger.info(
+        "API Success: %s - %d images generated in %.2fs (user: %s)",
+        endpoint, num_images, processing_time, user_id
+    )
 
 
 def get_base_url_from_request(request) -> str:
-    """从请求中获取基础URL"""
+    """从请求中获取基础URL（按scheme和host缓存，同一主机的请求复用同一个字符串）"""
     try:
-        # 构建基础URL
-        scheme = "https" if request.url.scheme == "https" else "http"
-        host = request.headers.get("host", request.url.netloc)
-        return f"{scheme}://{host}"
+        # 直接读取ASGI scope，避免构造request.url对象
+        scheme = request.scope.get("scheme", "http")
+        host = request.headers.get("host") or request.url.netloc
+        key = (scheme, host)
+        base_url = _BASE_URL_CACHE.get(key)
+        if base_url is None:
+            if len(_BASE_URL_CACHE) >= _BASE_URL_CACHE_MAX_SIZE:
+                _BASE_URL_CACHE.clear()
+            base_url = _BASE_URL_CACHE[key] = sys.intern(f"{scheme}://{host}")
+        return base_url
     except Exception:
         return ""
 
 
 def sanitize_filename(filename: str) -> str:
     """清理文件名，移除不安全字符"""
-    import re
-    # 移除或替换不安全字符
-    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
+    # 替换不安全字符（常见的无不安全字符情况只做逐字符的C级查找，不分配新字符串）
+    if any(c in filename for c in _UNSAFE_CHARS):
+        filename = filename.translate(_UNSAFE_FILENAME_CHARS)
     # 限制长度
     if len(filename) > 100:
         name, ext = filename.rsplit('.', 1) if '.' in filename else (filename, '')
@@ -136,11 +236,32 @@ def sanitize_filename(filename: str) -> str:
 def create_batch_response(
     images_list: List[List[Image.Image]],
     response_format: ResponseFormat,
-    base_url: str = ""
+    base_url: str = "",
+    output_format: OutputFormat = OutputFormat.PNG
 ) -> List[ImageResponse]:
-    """创建批量响应"""
+    """创建批量响应（同一批次共用一个创建时间戳）"""
+    created_ts = _unix_timestamp()
     responses = []
     for images in images_list:
-        response = create_image_response(images, response_format, base_url)
+        response = create_image_response(
+            images, response_format, base_url, output_format=output_format, created_ts=created_ts
+        )
         responses.append(response)
-    return responses
\ No newline at end of file
+    return responses
+
+
+async def create_batch_response_async(
+    images_list: List[List[Image.Image]],
+    response_format: ResponseFormat,
+    base_url: str = "",
+    output_format: OutputFormat = OutputFormat.PNG
+) -> List[ImageResponse]:
+    """异步创建批量响应：所有请求的图片一起在线程池中并行编码，总耗时接近最慢的一张而非逐个累加"""
+    created_ts = _unix_timestamp()
+    # 每张图片直接作为线程池任务提交（不在线程池任务中再调用create_image_response，避免嵌套等待同一线程池）
+    return list(await asyncio.gather(*[
+        create_image_response_async(
+            images, response_format, base_url, output_format=output_format, created_ts=created_ts
+        )
+        for images in images_list
+    ]))
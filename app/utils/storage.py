@@ -0,0 +1,86 @@
+import uuid
+from typing import Optional
+from PIL import Image
+import logging
+
+from app.core.config import settings
+from app.core.exceptions import ImageProcessingError
+from app.utils.image_utils import encode_image, save_image, create_image_url
+
+logger = logging.getLogger(__name__)
+
+# 各输出格式的Content-Type
+_CONTENT_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+class LocalStorage:
+    """本地文件存储：写入output_dir，通过/static提供访问"""
+    
+    def store(self, image: Image.Image, format: str = "PNG", base_url: str = "") -> str:
+        """保存图片并返回访问URL"""
+        file_path = save_image(image, format=format)
+        return create_image_url(file_path, base_url)
+
+
+class S3Storage:
+    """S3对象存储：编码结果直接从内存缓冲区上传，返回预签名URL，不经过本地磁盘"""
+    
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, expires: int = 3600):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("boto3 is required for the s3 storage backend, install it with: pip install boto3")
+        
+        # boto3客户端线程安全，可在编码线程池中共享
+        self._client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.expires = expires
+    
+    def store(self, image: Image.Image, format: str = "PNG", base_url: str = "") -> str:
+        """上传图片并返回预签名URL"""
+        key = f"{self.prefix}{uuid.uuid4().hex}.{format.lower()}"
+        try:
+            buffer = encode_image(image, format)
+            buffer.seek(0)
+            self._client.put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=buffer,
+                ContentType=_CONTENT_TYPES.get(format.upper(), "application/octet-stream"),
+                ChecksumAlgorithm="CRC32"
+            )
+            return self._client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": key},
+                ExpiresIn=self.expires
+            )
+        except Exception as e:
+            raise ImageProcessingError(f"Failed to upload image: {str(e)}")
+
+
+def create_storage():
+    """根据配置创建存储后端"""
+    backend = settings.storage_backend.strip().lower()
+    if backend not in ("local", "s3"):
+        raise RuntimeError(f"Unsupported STORAGE_BACKEND {settings.storage_backend!r}, expected 'local' or 's3'")
+    
+    if backend == "s3":
+        if not settings.s3_bucket:
+            raise RuntimeError("S3_BUCKET must be set when STORAGE_BACKEND is s3")
+        logger.info(f"Using S3 storage backend: bucket={settings.s3_bucket}")
+        return S3Storage(
+            bucket=settings.s3_bucket,
+            prefix=settings.s3_prefix,
+            endpoint_url=settings.s3_endpoint_url,
+            expires=settings.s3_presign_expires
+        )
+    return LocalStorage()
+
+
+# 全局存储后端实例
+storage = create_storage()
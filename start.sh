@@ -135,7 +135,7 @@ start_api() {
     # 检查是否在容器中运行
     if [ -f "/.dockerenv" ]; then
         log_info "Running in Docker container"
-        exec uvicorn app.main:app --host $HOST --port $PORT --workers 1
+        exec uvicorn app.main:app --host $HOST --port $PORT --workers 1 --loop uvloop --http httptools
     else
         # 本地运行
         if [ -d "venv" ] && [ -z "$VIRTUAL_ENV" ]; then
@@ -143,7 +143,7 @@ start_api() {
             source venv/bin/activate
         fi
         
-        uvicorn app.main:app --host $HOST --port $PORT --reload
+        uvicorn app.main:app --host $HOST --port $PORT --reload --loop uvloop --http httptools
     fi
 }
 